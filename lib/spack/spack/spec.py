@@ -972,8 +972,7 @@ class Spec(object):
         dep = self._dependencies.get(name)
         if dep is not None:
             return dep
-        raise InvalidDependencyError(
-            self.name + " does not depend on " + comma_or(name))
+        raise InvalidDependencyError(self.name, [name])
 
     def _find_deps(self, where, deptype):
         deptype = canonical_deptype(deptype)
@@ -1933,8 +1932,7 @@ class Spec(object):
 
         extra = set(user_spec_deps.keys()).difference(visited_user_specs)
         if extra:
-            raise InvalidDependencyError(
-                self.name + " does not depend on " + comma_or(extra))
+            raise InvalidDependencyError(self.name, extra)
 
         # This dictionary will store object IDs rather than Specs as keys
         # since the Spec __hash__ will change as patches are added to them
@@ -4052,6 +4050,17 @@ class InconsistentSpecError(SpecError):
 class InvalidDependencyError(SpecError):
     """Raised when a dependency in a spec is not actually a dependency
        of the package."""
+    def __init__(self, pkg, deps):
+        self.pkg = pkg
+        self.invalid_deps = list(deps)
+        super(InvalidDependencyError, self).__init__(
+            pkg + " does not depend on " + comma_or(self.invalid_deps))
+
+    def __reduce__(self):
+        # SpackError.__reduce__ replays cls(message, long_message),
+        # which does not match this signature; replay our own
+        # arguments so the exception survives pickling.
+        return type(self), (self.pkg, self.invalid_deps)
 
 
 class NoProviderError(SpecError):
@@ -0,0 +1,478 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import bisect
+import itertools
+import multiprocessing
+import os
+import traceback
+import weakref
+
+from six import string_types
+
+import spack.spec
+from spack.spec import Spec
+from spack.error import SpackError
+
+
+#: Ordering bucket by leading character: names (1) sort before versions,
+#: variants and flags (2), compilers (3), hashes (4) and dependencies (5).
+_ORDERING = [1] * 128
+_ORDERING[ord('~')] = _ORDERING[ord('-')] = 2
+_ORDERING[ord('+')] = _ORDERING[ord('@')] = 2
+_ORDERING[ord('%')] = 3
+_ORDERING[ord('/')] = 4
+_ORDERING[ord('^')] = 5
+
+
+def spec_ordering_key(s):
+    c = ord(s[0])
+    key = _ORDERING[c] if c < 128 else 1
+    # flags and variants spelled name=value have no sigil
+    return 2 if key == 1 and '=' in s else key
+
+
+#: Canonical spec string -> shared parsed Spec.  Weak values keep the
+#: cache from pinning Specs of lists that have been garbage collected.
+_spec_intern = weakref.WeakValueDictionary()
+
+
+def intern_spec(spec_or_string):
+    """Return a shared parsed Spec for a spec or string.
+
+    Equal canonical forms share one object, so repeated parses of the
+    same constraint across spec lists are paid once and equality
+    checks against cache keys degrade to identity.  Interned Specs
+    must never be mutated in place: constrain a copy() instead.
+    """
+    key = str(spec_or_string)
+    spec = _spec_intern.get(key)
+    if spec is None:
+        parsed = (spec_or_string if isinstance(spec_or_string, Spec)
+                  else Spec(key))
+        norm = str(parsed)
+        spec = _spec_intern.get(norm)
+        if spec is None:
+            spec = _spec_intern[norm] = parsed
+        if key != norm:
+            _spec_intern[key] = spec
+    return spec
+
+
+#: Minimum number of matrix combinations before exclude filtering is
+#: dispatched to a process pool.
+_PARALLEL_EXPANSION_THRESHOLD = 256
+
+#: Maximum number of worker processes for parallel matrix expansion.
+_MAX_EXPANSION_WORKERS = 8
+
+
+def _filter_combos(args):
+    """Filter one chunk of matrix combinations against excludes.
+
+    Module-level so it pickles for multiprocessing; takes and returns
+    only strings to keep pickling cheap and parses in the worker.
+    """
+    combos, excludes = args
+    exclude_specs = [Spec(x) for x in excludes]
+    rows = []
+    for combo in combos:
+        ordered_combo = sorted(combo, key=spec_ordering_key)
+        test_spec = Spec(' '.join(ordered_combo))
+        if any(test_spec.satisfies(x) for x in exclude_specs):
+            continue
+        rows.append(tuple(ordered_combo))
+    return rows
+
+
+def _filter_combos_parallel(axes, excludes):
+    """Expand and exclude-filter a matrix on a process pool.
+
+    Spec parsing is pure Python and holds the GIL, so threads would
+    not help; fork worker processes and hand each a chunk of the
+    product.  ``imap`` keeps chunks in order, so the result matches
+    the serial path row for row.
+    """
+    combos = list(itertools.product(*axes))
+    workers = min(_MAX_EXPANSION_WORKERS, multiprocessing.cpu_count())
+    chunk = (len(combos) + workers - 1) // workers
+    args = [(combos[i:i + chunk], excludes)
+            for i in range(0, len(combos), chunk)]
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        rows = []
+        for chunk_rows in pool.imap(_filter_combos, args):
+            rows.extend(chunk_rows)
+        return rows
+    finally:
+        pool.close()
+        pool.join()
+
+
+class _cached_by_version(object):
+    """Property that caches its value until the owner's ``_version``
+    counter changes.
+
+    Mutating methods bump ``_version`` once and every dependent cache
+    notices, instead of each method having to reset every cache
+    attribute by hand.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.attr = '_cached_' + func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        version, value = getattr(instance, self.attr, (None, None))
+        if version != instance._version:
+            value = self.func(instance)
+            setattr(instance, self.attr, (instance._version, value))
+        return value
+
+
+class SpecList(object):
+
+    def __init__(self, name='specs', yaml_list=[], reference={}):
+        self.name = name
+        self._reference = reference
+
+        # Validate yaml_list before assigning
+        if not all(isinstance(s, string_types) or isinstance(s, (list, dict))
+                   for s in yaml_list):
+            raise ValueError(
+                "yaml_list can contain only valid YAML types!  Found:\n  %s"
+                % [type(s) for s in yaml_list])
+        self.yaml_list = yaml_list[:]
+
+        # Expansions can be expensive to compute and difficult to keep
+        # updated.  Results are cached against this counter, which is
+        # bumped whenever self.yaml_list or the references change.
+        self._version = 0
+
+        # Lazily-built index of canonical spec string -> raw strings
+        # in yaml_list, maintained incrementally by add() and remove()
+        self._index = None
+
+    @property
+    def is_matrix(self):
+        for item in self.specs_as_yaml_list:
+            if isinstance(item, dict):
+                return True
+        return False
+
+    @_cached_by_version
+    def specs_as_yaml_list(self):
+        return self._expand_references(self.yaml_list)
+
+    @_cached_by_version
+    def specs_as_constraints(self):
+        # Rows are cached as plain strings; Spec objects are only
+        # materialized once a consumer actually asks for them.  The
+        # intern cache supplies one parse per unique string; hand out
+        # copies so consumers cannot corrupt it.
+        return [[intern_spec(s).copy() for s in row]
+                for row in self._raw_constraints]
+
+    @_cached_by_version
+    def _raw_constraints(self):
+        # Matrix expansion re-uses the same strings across many
+        # combinations; parse each unique string only once.
+        parsed = {}
+
+        def parse(string):
+            spec = parsed.get(string)
+            if spec is None:
+                spec = parsed[string] = intern_spec(string)
+            return spec
+
+        # Matrix rows repeat strings heavily, so compute each
+        # string's ordering key only once per expansion.
+        keys = {}
+
+        def ordering_key(string):
+            key = keys.get(string)
+            if key is None:
+                key = keys[string] = spec_ordering_key(string)
+            return key
+
+        # Bind hot names to locals; global and attribute lookups add
+        # up over millions of matrix rows.  Note isinstance checks
+        # must stay: yaml parsing yields dict and list subclasses.
+        product = itertools.product
+        bisect_right = bisect.bisect_right
+        rows = []
+        append_row = rows.append
+
+        for item in self.specs_as_yaml_list:
+            if isinstance(item, dict):  # matrix of specs
+                excludes = item.get('exclude', [])
+                exclude_specs = [parse(x) for x in excludes]
+
+                # An axis entry that satisfies an exclude on its own
+                # dooms every combination it appears in, so prune it
+                # before the product instead of materializing and
+                # rejecting all of its combinations.  An anonymous
+                # entry satisfies named excludes vacuously, so only
+                # prune on a name match (or an anonymous exclude).
+                axes = []
+                for axis in item['matrix']:
+                    if exclude_specs:
+                        axis = [e for e in axis
+                                if not _always_excluded(parse(e),
+                                                        exclude_specs)]
+                    axes.append(axis)
+
+                if not axes:
+                    continue
+
+                # Exclude filtering parses and tests one spec per
+                # surviving row; hand large matrices to a process
+                # pool instead of filtering them here.
+                n_combos = 1
+                for axis in axes:
+                    n_combos *= len(axis)
+                if excludes and n_combos >= _PARALLEL_EXPANSION_THRESHOLD:
+                    rows.extend(_filter_combos_parallel(axes, excludes))
+                    continue
+
+                # Combinations differ only in their last axis entry,
+                # so sort the prefix once per outer tuple and insert
+                # the last entry by bisection instead of re-sorting
+                # the whole combination every time.  Inserting after
+                # equal keys matches what a stable sort would do.
+                for prefix in product(*axes[:-1]):
+                    ordered_prefix = sorted(prefix, key=ordering_key)
+                    prefix_keys = [ordering_key(s)
+                                   for s in ordered_prefix]
+                    for last in axes[-1]:
+                        idx = bisect_right(prefix_keys,
+                                           ordering_key(last))
+                        ordered_combo = (ordered_prefix[:idx] + [last] +
+                                         ordered_prefix[idx:])
+
+                        # Test against the excludes using a single
+                        # spec; satisfies() would re-parse a raw
+                        # string on every row, so pass the Specs
+                        # parsed once above.  With no excludes there
+                        # is nothing to test, so skip the parse.
+                        if exclude_specs:
+                            test_spec = Spec(' '.join(ordered_combo))
+                            if any(test_spec.satisfies(x)
+                                   for x in exclude_specs):
+                                continue
+
+                        # Add as an ordered row of constraint strings
+                        append_row(tuple(ordered_combo))
+            else:  # individual spec
+                append_row((item,))
+        return rows
+
+    @_cached_by_version
+    def specs(self):
+        # Rows are already ordered constraint strings, so one parse of
+        # the joined row yields the final spec directly.  This skips
+        # materializing per-row constraint Specs and constraining them
+        # together, and leaves specs_as_constraints unbuilt unless a
+        # consumer asks for it.
+        return [Spec(' '.join(row)) for row in self._raw_constraints]
+
+    @_cached_by_version
+    def concrete_specs(self):
+        rows = self._raw_constraints
+
+        # Concretization dominates environment resolution and each row
+        # is independent, so fan rows out to worker processes.  Set
+        # SPACK_NO_PARALLEL_CONCRETIZE to force the serial path when
+        # debugging.
+        if len(rows) > 1 and 'SPACK_NO_PARALLEL_CONCRETIZE' not in os.environ:
+            workers = min(_MAX_EXPANSION_WORKERS,
+                          multiprocessing.cpu_count(), len(rows))
+            pool = multiprocessing.Pool(workers)
+            try:
+                results = pool.map(_concretize_row, rows)
+            finally:
+                pool.close()
+                pool.join()
+
+            concrete = []
+            for row, (ok, payload) in zip(rows, results):
+                if not ok:
+                    etype, msg, tb = payload
+                    raise SpecListError(
+                        'Concretization of %s failed: %s: %s'
+                        % (' '.join(row), etype, msg), tb)
+                concrete.append(Spec.from_yaml(payload))
+            return concrete
+
+        return [_concretize_from_constraints([Spec(s) for s in row])
+                for row in rows]
+
+    def _spec_index(self):
+        """Index of canonical spec string -> raw strings in yaml_list.
+
+        Lets remove() parse only its argument instead of re-parsing
+        the whole list on every call.  Matrices and references are not
+        indexed; they cannot be removed by value.
+        """
+        if self._index is None:
+            index = {}
+            for s in self.yaml_list:
+                if isinstance(s, string_types) and not s.startswith('$'):
+                    index.setdefault(str(intern_spec(s)), []).append(s)
+            self._index = index
+        return self._index
+
+    def add(self, spec):
+        spec = str(spec)
+        self.yaml_list.append(spec)
+        # References are not indexed (they cannot be removed by
+        # value), so do not try to parse them here either.
+        if self._index is not None and not spec.startswith('$'):
+            self._index.setdefault(str(intern_spec(spec)), []).append(spec)
+        self._version += 1
+
+    def remove(self, spec):
+        # Get strings to remove from the list; there may be more than
+        # one raw string representation of the same spec
+        remove = self._spec_index().pop(str(intern_spec(spec)), [])
+        if not remove:
+            msg = 'Cannot remove %s from SpecList %s\n' % (spec, self.name)
+            msg += 'Either %s is not in list or it is a matrix and ' % spec
+            msg += 'matrices cannot be removed by value.'
+            raise SpecListError(msg)
+
+        for item in remove:
+            self.yaml_list.remove(item)
+        self._version += 1
+
+    def update_reference(self, reference):
+        self._reference = reference
+        self._version += 1
+
+    def _expand_references(self, yaml):
+        if isinstance(yaml, list):
+            # Common case first: one scan to detect references and
+            # nested collections.  A list with neither expands to
+            # itself, so return it without allocating a copy.
+            has_ref = False
+            has_nested = False
+            for item in yaml:
+                if isinstance(item, (list, dict)):
+                    has_nested = True
+                elif isinstance(item, string_types) and item.startswith('$'):
+                    has_ref = True
+                    break
+            if not has_ref:
+                if not has_nested:
+                    return yaml
+                return [self._expand_references(item)
+                        if isinstance(item, (list, dict)) else item
+                        for item in yaml]
+
+            # Build the output in a single pass, splicing in the
+            # expansion of each reference as it is encountered.
+            expanded = []
+            for item in yaml:
+                if isinstance(item, string_types) and item.startswith('$'):
+                    name = item[1:]
+                    if name not in self._reference:
+                        msg = 'SpecList %s refers to ' % self.name
+                        msg += 'named list %s ' % name
+                        msg += 'which does not appear in its reference dict'
+                        raise UndefinedReferenceError(msg)
+                    expanded.extend(self._reference[name].specs_as_yaml_list)
+                elif isinstance(item, (list, dict)):
+                    expanded.append(self._expand_references(item))
+                else:
+                    expanded.append(item)
+            return expanded
+        elif isinstance(yaml, dict):
+            # There can't be expansions in dicts
+            return dict((name, self._expand_references(val))
+                        for (name, val) in yaml.items())
+        else:
+            # Strings are just returned
+            return yaml
+
+    def __len__(self):
+        return len(self.specs)
+
+    def __getitem__(self, key):
+        return self.specs[key]
+
+
+def _always_excluded(spec, exclude_specs):
+    """Whether ``spec`` satisfies an exclude no matter what it is
+    combined with."""
+    return any((x.name is None or spec.name == x.name) and
+               spec.satisfies(x, strict=True)
+               for x in exclude_specs)
+
+
+def _concretize_row(row):
+    """Concretize one constraint row in a worker process.
+
+    Takes raw constraint strings and returns the concrete spec as
+    yaml, so only cheap, picklable data crosses the process boundary;
+    re-parsing the row in the worker is noise next to concretization.
+    Errors are returned as plain strings rather than exception
+    objects: not every Spack error survives a pickle round-trip, and
+    one that fails to unpickle kills the pool's result handler and
+    hangs the parent forever.
+    """
+    try:
+        concrete = _concretize_from_constraints([Spec(s) for s in row])
+        return (True, concrete.to_yaml(all_deps=True))
+    except Exception as e:
+        return (False, (type(e).__name__, str(e), traceback.format_exc()))
+
+
+def _concretize_from_constraints(spec_constraints):
+    # Accept only valid constraints from list and concretize spec
+    # Get the named spec even if out of order
+    root_specs = [s for s in spec_constraints if s.name]
+    if len(root_specs) != 1:
+        m = 'The constraints %s are not a valid spec ' % spec_constraints
+        m += 'concretization target. all specs must have a single name '
+        m += 'constraint for concretization.'
+        raise InvalidSpecConstraintError(m)
+    root_spec = root_specs[0]
+
+    # Work on our own list: the caller may hand us a cached constraint
+    # row, and the retry path below drops entries from it.
+    spec_constraints = [s for s in spec_constraints if s is not root_spec]
+
+    while True:
+        # Attach all anonymous constraints to one named spec
+        s = root_spec.copy()
+        for c in spec_constraints:
+            s.constrain(c)
+        try:
+            return s.concretized()
+        except spack.spec.InvalidDependencyError as e:
+            invalid_deps_string = ['^' + d for d in e.invalid_deps]
+            invalid_deps = [c for c in spec_constraints
+                            if any(c.satisfies(d, strict=True)
+                                   for d in invalid_deps_string)]
+            if len(invalid_deps) != len(invalid_deps_string):
+                raise e
+            spec_constraints = [c for c in spec_constraints
+                                if c not in invalid_deps]
+
+
+class SpecListError(SpackError):
+    """Error class for all errors related to SpecList objects."""
+
+
+class UndefinedReferenceError(SpecListError):
+    """Error class for undefined references in Spack stacks."""
+
+
+class InvalidSpecConstraintError(SpecListError):
+    """Error class for invalid spec constraints at concretize time."""
@@ -0,0 +1,229 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import pytest
+
+import spack.spec_list
+from spack.spec_list import SpecList, SpecListError, UndefinedReferenceError
+from spack.spec_list import InvalidSpecConstraintError
+from spack.spec import Spec
+
+
+class TestSpecList(object):
+    default_input = ['mpileaks', '$mpis',
+                     {'matrix': [['hypre'], ['%gcc@4.5.0', '%clang@3.3']]},
+                     'libelf']
+
+    default_reference = {'mpis':
+                         SpecList('mpis', ['zmpi@1.0', 'mpich@3.0'])}
+
+    default_expansion = ['mpileaks', 'zmpi@1.0', 'mpich@3.0',
+                         {'matrix': [['hypre'],
+                                     ['%gcc@4.5.0', '%clang@3.3']]},
+                         'libelf']
+
+    default_constraints = [[Spec('mpileaks')],
+                           [Spec('zmpi@1.0')],
+                           [Spec('mpich@3.0')],
+                           [Spec('hypre'), Spec('%gcc@4.5.0')],
+                           [Spec('hypre'), Spec('%clang@3.3')],
+                           [Spec('libelf')]]
+
+    default_specs = [Spec('mpileaks'), Spec('zmpi@1.0'),
+                     Spec('mpich@3.0'), Spec('hypre%gcc@4.5.0'),
+                     Spec('hypre%clang@3.3'), Spec('libelf')]
+
+    def test_spec_list_expansions(self):
+        speclist = SpecList('specs', self.default_input,
+                            self.default_reference)
+
+        assert speclist.specs_as_yaml_list == self.default_expansion
+        assert speclist.specs_as_constraints == self.default_constraints
+        assert speclist.specs == self.default_specs
+
+    def test_spec_list_expansion_no_references(self):
+        speclist = SpecList('specs', ['mpileaks', 'zlib@1.2.11'])
+
+        assert speclist.specs_as_yaml_list == ['mpileaks', 'zlib@1.2.11']
+        assert speclist.specs == [Spec('mpileaks'), Spec('zlib@1.2.11')]
+
+        speclist.add('libelf')
+        assert speclist.specs_as_yaml_list == ['mpileaks', 'zlib@1.2.11',
+                                               'libelf']
+
+    def test_spec_list_constraint_ordering(self):
+        specs = [{'matrix': [
+            ['^zmpi'],
+            ['%gcc@4.5.0'],
+            ['hypre', 'libelf'],
+            ['~shared'],
+            ['cflags=-O3'],
+            ['^foo', '^bar']
+        ]}]
+
+        speclist = SpecList('specs', specs)
+
+        # Constraints are ordered: names, then variants/flags, then
+        # compilers, then hashes, then dependencies.  Order is stable
+        # among constraints of the same kind.
+        expected_ordering = [
+            ['hypre', '~shared', 'cflags=-O3', '%gcc@4.5.0',
+             '^zmpi', '^foo'],
+            ['hypre', '~shared', 'cflags=-O3', '%gcc@4.5.0',
+             '^zmpi', '^bar'],
+            ['libelf', '~shared', 'cflags=-O3', '%gcc@4.5.0',
+             '^zmpi', '^foo'],
+            ['libelf', '~shared', 'cflags=-O3', '%gcc@4.5.0',
+             '^zmpi', '^bar'],
+        ]
+        expected = [[Spec(c) for c in row] for row in expected_ordering]
+        assert speclist.specs_as_constraints == expected
+
+    def test_spec_list_exclude(self):
+        matrix = [{'matrix': [['hypre', 'libelf'],
+                              ['%gcc@4.5.0', '%clang@3.3']],
+                   'exclude': ['hypre%gcc']}]
+        speclist = SpecList('specs', matrix)
+
+        expected = [Spec('hypre%clang@3.3'),
+                    Spec('libelf%gcc@4.5.0'),
+                    Spec('libelf%clang@3.3')]
+        assert speclist.specs == expected
+
+    def test_spec_list_constraints_not_mutated_by_specs(self):
+        speclist = SpecList('specs', self.default_input,
+                            self.default_reference)
+
+        # Computing specs constrains copies; the constraint rows are
+        # cached and must not change.
+        assert speclist.specs == self.default_specs
+        assert speclist.specs_as_constraints == self.default_constraints
+
+    def test_spec_list_exclude_single_axis(self):
+        # An exclude satisfied by one axis entry alone prunes that
+        # entry's combinations entirely.
+        matrix = [{'matrix': [['hypre', 'libelf'],
+                              ['%gcc@4.5.0', '%clang@3.3']],
+                   'exclude': ['%gcc@4.5.0']}]
+        speclist = SpecList('specs', matrix)
+
+        expected = [Spec('hypre%clang@3.3'), Spec('libelf%clang@3.3')]
+        assert speclist.specs == expected
+
+    def test_spec_list_parallel_expansion_matches_serial(self, monkeypatch):
+        matrix = [{'matrix': [['hypre', 'libelf'],
+                              ['%gcc@4.5.0', '%clang@3.3']],
+                   'exclude': ['hypre%gcc']}]
+        serial = SpecList('specs', matrix).specs
+
+        monkeypatch.setattr(
+            spack.spec_list, '_PARALLEL_EXPANSION_THRESHOLD', 1)
+        parallel = SpecList('specs', matrix).specs
+
+        assert parallel == serial
+
+    def test_spec_list_add(self):
+        speclist = SpecList('specs', self.default_input,
+                            self.default_reference)
+
+        speclist.add('libdwarf')
+
+        assert speclist.specs_as_yaml_list == (
+            self.default_expansion + ['libdwarf'])
+        assert speclist.specs_as_constraints == (
+            self.default_constraints + [[Spec('libdwarf')]])
+        assert speclist.specs == self.default_specs + [Spec('libdwarf')]
+
+    def test_spec_list_remove(self):
+        speclist = SpecList('specs', self.default_input,
+                            self.default_reference)
+
+        speclist.remove('libelf')
+
+        assert speclist.specs_as_yaml_list + ['libelf'] == (
+            self.default_expansion)
+        assert speclist.specs_as_constraints + [[Spec('libelf')]] == (
+            self.default_constraints)
+        assert speclist.specs + [Spec('libelf')] == self.default_specs
+
+    def test_spec_list_add_reference_after_remove(self):
+        speclist = SpecList('specs', ['mpileaks', 'libelf'],
+                            self.default_reference)
+
+        # remove() builds the string index; adding a reference
+        # afterwards must not try to parse it into the index
+        speclist.remove('libelf')
+        speclist.add('$mpis')
+
+        assert speclist.specs_as_yaml_list == ['mpileaks', 'zmpi@1.0',
+                                               'mpich@3.0']
+        assert speclist.specs == [Spec('mpileaks'), Spec('zmpi@1.0'),
+                                  Spec('mpich@3.0')]
+
+    def test_spec_list_cannot_remove_matrix_spec(self):
+        speclist = SpecList('specs', self.default_input,
+                            self.default_reference)
+
+        with pytest.raises(SpecListError):
+            speclist.remove('hypre')
+
+    def test_spec_list_update_reference(self):
+        speclist = SpecList('specs', self.default_input,
+                            self.default_reference)
+
+        new_mpis = SpecList('mpis', self.default_reference['mpis'].yaml_list)
+        new_mpis.add('mpich@3.3')
+        new_reference = {'mpis': new_mpis}
+        speclist.update_reference(new_reference)
+
+        expansion = list(self.default_expansion)
+        expansion.insert(3, 'mpich@3.3')
+        constraints = list(self.default_constraints)
+        constraints.insert(3, [Spec('mpich@3.3')])
+        specs = list(self.default_specs)
+        specs.insert(3, Spec('mpich@3.3'))
+
+        assert speclist.specs_as_yaml_list == expansion
+        assert speclist.specs_as_constraints == constraints
+        assert speclist.specs == specs
+
+    def test_spec_list_undefined_reference_error(self):
+        speclist = SpecList('specs', ['zlib', '$mpis'])
+
+        with pytest.raises(UndefinedReferenceError):
+            speclist.specs
+
+    def test_concretize_requires_single_named_root(self):
+        # No named spec in the row
+        with pytest.raises(InvalidSpecConstraintError):
+            spack.spec_list._concretize_from_constraints([Spec('%gcc')])
+
+        # More than one named spec in the row
+        with pytest.raises(InvalidSpecConstraintError):
+            spack.spec_list._concretize_from_constraints(
+                [Spec('mpileaks'), Spec('libelf')])
+
+    def test_concrete_specs_parallel_error_propagates(self, monkeypatch):
+        monkeypatch.delenv('SPACK_NO_PARALLEL_CONCRETIZE', raising=False)
+
+        # Two rows, each with two named specs: every worker fails row
+        # validation, and the errors must come back through the pool
+        # and raise in the parent rather than hang it.
+        matrix = [{'matrix': [['zlib'], ['libelf', 'mpileaks']]}]
+        speclist = SpecList('specs', matrix)
+
+        with pytest.raises(SpecListError, match='Concretization of'):
+            speclist.concrete_specs
+
+    def test_spec_list_extension(self):
+        speclist = SpecList('specs', self.default_input,
+                            self.default_reference)
+
+        new_ref = self.default_reference.copy()
+        new_ref['specs'] = speclist
+        otherlist = SpecList('specs', ['zlib', '$specs'], new_ref)
+
+        assert otherlist.specs_as_yaml_list == (
+            ['zlib'] + self.default_expansion)
+        assert otherlist.specs == [Spec('zlib')] + self.default_specs